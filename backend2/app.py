@@ -4,20 +4,32 @@ Backend 2 - Flask + MySQL (Productos) - VERSIÓN FINAL CORREGIDA
 Sistema SOA - Gestión de Productos
 """
 import os
+import time
+import tempfile
+import threading
 import pymysql
 import jwt
+from collections import Counter
 from functools import wraps
 from datetime import datetime
 from dotenv import load_dotenv
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, g, has_request_context
 from flask_cors import CORS
 from flask_restful import Api, Resource
 from flasgger import Swagger, swag_from
 from marshmallow import Schema, fields, ValidationError
+from werkzeug.exceptions import HTTPException
 
 import json
-from decimal import Decimal
+from decimal import Decimal, ROUND_HALF_UP
+
+from cache_bus import LocalCache, InvalidationBus, create_transport
+from jobs import JobRunner, JobQueueFull
+from migrations import migrate
+from catalog_snapshot import CatalogSnapshot, write_snapshot
+from rate_limit import TokenBucketLimiter
+from product_queries import LIST_PRODUCTS_SQL, PRODUCT_FACETS_SQL, PRODUCTS_BY_CATEGORY_SQL, CATALOG_STAMP_SQL
 
 # Cargar variables de entorno al inicio de la aplicación
 load_dotenv()
@@ -39,12 +51,51 @@ app.config['MYSQL_USER'] = os.environ.get('MYSQL_USER', 'root')
 app.config['MYSQL_PASSWORD'] = os.environ.get('MYSQL_PASSWORD', '')
 app.config['MYSQL_DB'] = os.environ.get('MYSQL_DB', 'soa_products')
 app.config['MYSQL_PORT'] = int(os.environ.get('MYSQL_PORT', 3306))
+app.config['PRODUCT_CACHE_TTL'] = int(os.environ.get('PRODUCT_CACHE_TTL', 300))
+app.config['PRODUCT_BATCH_MAX_IDS'] = int(os.environ.get('PRODUCT_BATCH_MAX_IDS', 200))
+app.config['CATALOG_SNAPSHOT_ENABLED'] = os.environ.get('CATALOG_SNAPSHOT_ENABLED', 'true').lower() == 'true'
+app.config['CATALOG_SNAPSHOT_PATH'] = os.environ.get(
+    'CATALOG_SNAPSHOT_PATH', os.path.join(tempfile.gettempdir(), 'backend2-catalog-v1.snap'))
+# Cada cuánto un worker compara el stamp del snapshot con MySQL (una agregación sobre products)
+app.config['CATALOG_SNAPSHOT_REVALIDATE_SECONDS'] = int(os.environ.get('CATALOG_SNAPSHOT_REVALIDATE_SECONDS', 30))
+# Espera máxima por el lock de construcción; debe quedar por debajo de MYSQL_READ_TIMEOUT
+app.config['CATALOG_SNAPSHOT_LOCK_TIMEOUT'] = int(os.environ.get('CATALOG_SNAPSHOT_LOCK_TIMEOUT', 20))
+
+# Presupuesto de tiempo por solicitud (ms). Por debajo de los 15s de timeout de axios
+app.config['REQUEST_DEADLINE_MS'] = int(os.environ.get('REQUEST_DEADLINE_MS', 10000))
+app.config['ROUTE_DEADLINES_MS'] = {
+    'productlistresource': 12000,
+    'productfacetsresource': 3000,
+    'productresource': 5000,
+    'productdecreasestockresource': 5000,
+}
+app.config['MYSQL_CONNECT_TIMEOUT'] = int(os.environ.get('MYSQL_CONNECT_TIMEOUT', 10))
+app.config['MYSQL_READ_TIMEOUT'] = int(os.environ.get('MYSQL_READ_TIMEOUT', 30))
+app.config['MYSQL_WRITE_TIMEOUT'] = int(os.environ.get('MYSQL_WRITE_TIMEOUT', 30))
+
+# Límite de tasa por cliente: (capacidad, tokens por segundo) por "endpoint.MÉTODO" o endpoint.
+# "endpoint.MÉTODO.ids" aplica a las lecturas por lote (?ids=), que son búsquedas por clave primaria
+app.config['RATE_LIMIT_ENABLED'] = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+app.config['RATE_LIMIT_MAX_CLIENTS'] = int(os.environ.get('RATE_LIMIT_MAX_CLIENTS', 10000))
+app.config['RATE_LIMIT_DEFAULT'] = (60, 10)
+app.config['RATE_LIMITS'] = {
+    'productlistresource.GET': (20, 0.5),
+    'productlistresource.GET.ids': (120, 10),
+    'productdecreasestockresource': (200, 20),
+}
+
+# Trabajos en segundo plano
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+app.config['JOB_MAX_PENDING'] = int(os.environ.get('JOB_MAX_PENDING', 50))
+app.config['JOB_BATCH_SIZE'] = int(os.environ.get('JOB_BATCH_SIZE', 500))
+app.config['JOB_HEARTBEAT_SECONDS'] = int(os.environ.get('JOB_HEARTBEAT_SECONDS', 10))
 
 # CORS configurado correctamente
 CORS(app, origins=['http://localhost:5173', 'http://localhost:3001'], 
      supports_credentials=True,
      methods=['GET', 'POST', 'PUT', 'DELETE', 'PATCH', 'OPTIONS'],
-     allow_headers=['Content-Type', 'Authorization', 'X-Requested-With'])
+     allow_headers=['Content-Type', 'Authorization', 'X-Requested-With', 'X-Request-Timeout', 'If-Match'],
+     expose_headers=['ETag', 'X-RateLimit-Limit', 'X-RateLimit-Remaining', 'X-RateLimit-Reset', 'Retry-After'])
 
 api = Api(app)
 
@@ -87,9 +138,11 @@ class ProductSchema(Schema):
     image_url = fields.Url(required=True)
     created_at = fields.DateTime(dump_only=True)
     updated_at = fields.DateTime(dump_only=True)
+    version = fields.Int(dump_only=True)
 
 product_schema = ProductSchema()
 products_schema = ProductSchema(many=True)
+product_patch_schema = ProductSchema(partial=True)
 
 # --- Función de serialización mejorada ---
 def serialize_product(product):
@@ -110,8 +163,261 @@ def serialize_product(product):
             serialized[key] = value
     return serialized
 
+# --- Control de concurrencia optimista (version + ETag/If-Match) ---
+def product_etag(product):
+    return f'"{product["version"]}"'
+
+def parse_if_match():
+    """Versiones aceptadas según If-Match; None si no se envió o es '*'.
+
+    If-Match usa comparación fuerte: un ETag débil (W/) o que no es una
+    versión válida nunca coincide. Si ninguno coincide la lista queda vacía
+    y la escritura termina en 412 como indica HTTP.
+    """
+    raw = (request.headers.get('If-Match') or '').strip()
+    if not raw or raw == '*':
+        return None
+    versions = []
+    for tag in raw.split(','):
+        tag = tag.strip()
+        if len(tag) > 2 and tag[0] == tag[-1] == '"' and tag[1:-1].isdigit():
+            versions.append(int(tag[1:-1]))
+    return versions
+
+def version_condition(expected_versions):
+    """Condición SQL del compare-and-swap para las versiones de If-Match"""
+    if not expected_versions:
+        return " AND FALSE", []
+    return f" AND version IN ({', '.join(['%s'] * len(expected_versions))})", list(expected_versions)
+
+PATCH_ATTEMPTS = 2
+
+PRECONDITION_FAILED = ({
+    'success': False,
+    'message': 'El producto fue modificado por otro usuario. Recarga e intenta de nuevo',
+    'code': 'VERSION_CONFLICT'
+}, 412)
+
+# --- Diferencias para actualizaciones parciales ---
+PRICE_QUANTUM = Decimal('0.01')
+
+def diff_product_changes(current, changes):
+    """Devuelve solo las columnas cuyo valor difiere de la fila actual.
+
+    El precio se normaliza a DECIMAL(10, 2) redondeando como MySQL (mitades
+    lejos de cero) para que 10 y 10.001 no cuenten como cambio cuando MySQL
+    guardaría el mismo valor.
+    """
+    diff = {}
+    for key, value in changes.items():
+        if key in ['id', 'created_at', 'updated_at', 'version']:
+            continue
+        if key == 'price':
+            value = Decimal(str(value)).quantize(PRICE_QUANTUM, rounding=ROUND_HALF_UP)
+        if current.get(key) != value:
+            diff[key] = value
+    return diff
+
+# --- Serialización compacta para listas grandes ---
+STREAM_BATCH_ROWS = 500
+
+def _json_value(value):
+    """Convierte un valor de columna a un tipo serializable en JSON."""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def iter_products_json(columns, rows):
+    """Genera la respuesta JSON de la lista a partir de filas tupla y un encabezado compartido.
+
+    Cada fila se codifica y se descarta al momento, así que en memoria solo vive
+    un lote de cadenas ya codificadas en lugar de la lista completa de dicts.
+
+    El status 200 ya se envió cuando empieza el cuerpo: si la lectura falla a
+    mitad de camino se cierra el JSON con un objeto `error` y `data` queda
+    incompleta. Los clientes deben revisar `error` además de `success`.
+    """
+    yield '{"success": true, "data": ['
+    count = 0
+    batch = []
+    error = None
+    try:
+        for row in rows:
+            batch.append(json.dumps(dict(zip(columns, map(_json_value, row)))))
+            count += 1
+            if len(batch) >= STREAM_BATCH_ROWS:
+                yield (',' if count > len(batch) else '') + ','.join(batch)
+                batch = []
+    except Exception as e:
+        print(f"Error en GET /api/products (streaming): {e}")
+        error = {'code': 'STREAM_ERROR', 'message': str(e)}
+    if batch:
+        yield (',' if count > len(batch) else '') + ','.join(batch)
+    if error:
+        yield f'], "count": {count}, "error": {json.dumps(error)}}}'
+    else:
+        yield f'], "count": {count}}}'
+
+# --- Caché de productos por worker + bus de invalidación ---
+product_cache = LocalCache(ttl=app.config['PRODUCT_CACHE_TTL'])
+cache_bus = InvalidationBus(create_transport())
+cache_bus.attach(product_cache)
+cache_bus.start()
+
+def product_cache_key(product_id):
+    return f"product:{product_id}"
+
+# Snapshot del catálogo: se registra en el bus antes de cargarse para no perder
+# invalidaciones que lleguen mientras se construye (ver warm_start_catalog)
+catalog_snapshot = CatalogSnapshot(app.config['CATALOG_SNAPSHOT_PATH'], key=product_cache_key)
+cache_bus.attach(catalog_snapshot)
+
+def get_cached_product(product_id):
+    """Producto desde la caché del worker o, si no está, desde el snapshot mapeado"""
+    return product_cache.get(product_cache_key(product_id)) or catalog_snapshot.get(product_id)
+
+# --- Límite de tasa por cliente ---
+rate_limiter = TokenBucketLimiter(max_keys=app.config['RATE_LIMIT_MAX_CLIENTS'])
+
+def rate_limit_client_key():
+    """userId del JWT si es válido; si no, la IP del cliente"""
+    auth_header = request.headers.get('Authorization', '')
+    token = auth_header.split(' ')[1] if auth_header.startswith('Bearer ') else auth_header
+    if token:
+        try:
+            user_id = jwt.decode(token, JWT_SECRET, algorithms=['HS256']).get('userId')
+            if user_id:
+                return f"user:{user_id}"
+        except jwt.InvalidTokenError:
+            pass
+    return f"ip:{request.remote_addr}"
+
+@app.before_request
+def apply_rate_limit():
+    """Token bucket por (cliente, ruta); responde 429 cuando el bucket está vacío"""
+    if not app.config['RATE_LIMIT_ENABLED'] or request.method == 'OPTIONS' or not request.path.startswith('/api/'):
+        return None
+    limits = app.config['RATE_LIMITS']
+    route = f"{request.endpoint}.{request.method}"
+    if 'ids' in request.args and f"{route}.ids" in limits:
+        route = f"{route}.ids"
+    if route not in limits:
+        route = request.endpoint if request.endpoint in limits else 'default'
+    capacity, refill_rate = limits.get(route, app.config['RATE_LIMIT_DEFAULT'])
+
+    allowed, remaining, reset_after, retry_after = rate_limiter.hit(
+        (rate_limit_client_key(), route), capacity, refill_rate)
+    g.rate_limit_headers = {
+        'X-RateLimit-Limit': str(capacity),
+        'X-RateLimit-Remaining': str(remaining),
+        'X-RateLimit-Reset': str(reset_after)
+    }
+    if not allowed:
+        response = jsonify({
+            'success': False,
+            'message': f'Demasiadas solicitudes. Intenta de nuevo en {retry_after} s',
+            'code': 'RATE_LIMITED'
+        })
+        response.status_code = 429
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+    return None
+
+@app.after_request
+def add_rate_limit_headers(response):
+    for header, value in g.get('rate_limit_headers', {}).items():
+        response.headers[header] = value
+    return response
+
+# --- Deadlines por solicitud ---
+class DeadlineExceeded(HTTPException):
+    code = 504
+    description = 'Tiempo límite de la solicitud agotado'
+
+    def __init__(self):
+        super().__init__()
+        self.data = {'success': False, 'message': self.description, 'code': 'DEADLINE_EXCEEDED'}
+
+deadline_exceeded_counts = Counter()
+_deadline_lock = threading.Lock()
+
+@app.before_request
+def start_request_deadline():
+    """Fija el deadline: presupuesto de la ruta, acotado por el header X-Request-Timeout (ms)"""
+    budget_ms = app.config['ROUTE_DEADLINES_MS'].get(request.endpoint, app.config['REQUEST_DEADLINE_MS'])
+    client_ms = request.headers.get('X-Request-Timeout', type=int)
+    if client_ms and client_ms > 0:
+        budget_ms = min(budget_ms, client_ms)
+    g.deadline = time.monotonic() + budget_ms / 1000.0
+
+def _deadline_route():
+    return f"{request.method} {request.url_rule.rule if request.url_rule else request.path}"
+
+def record_deadline_exceeded(route):
+    with _deadline_lock:
+        deadline_exceeded_counts[route] += 1
+    print(f"⏱️ Deadline agotado en {route}")
+
+def stream_with_deadline(chunks):
+    """Envuelve un cuerpo en streaming para contar el deadline cuando termina de enviarse.
+
+    after_request corre antes de que se genere el cuerpo, así que en las
+    respuestas en streaming la cuenta se hace aquí.
+    """
+    deadline = g.get('deadline')
+    route = _deadline_route()
+
+    def generate():
+        try:
+            yield from chunks
+        finally:
+            if deadline is not None and time.monotonic() > deadline:
+                record_deadline_exceeded(route)
+    return generate()
+
+@app.after_request
+def check_request_deadline(response):
+    """Cuenta las solicitudes que agotaron su presupuesto y las reporta como 504"""
+    deadline = g.get('deadline')
+    if response.is_streamed or deadline is None or time.monotonic() <= deadline:
+        return response
+    record_deadline_exceeded(_deadline_route())
+    if response.status_code >= 500:
+        response.status_code = 504
+    return response
+
+def remaining_time():
+    """Segundos que le quedan a la solicitud actual, o None fuera de una solicitud"""
+    if not has_request_context() or g.get('deadline') is None:
+        return None
+    return g.deadline - time.monotonic()
+
 # --- Conexión a MySQL ---
 def get_db_connection():
+    """Abre una conexión acotada por el presupuesto que le queda a la solicitud.
+
+    Los timeouts de socket y max_execution_time se fijan al abrir la conexión:
+    las sentencias posteriores de la misma solicitud heredan esa ventana, no la
+    que queda en ese momento. Los handlers actuales hacen a lo sumo un SELECT
+    pesado (el primero); el resto son lecturas por clave primaria.
+    """
+    connect_timeout = app.config['MYSQL_CONNECT_TIMEOUT']
+    read_timeout = app.config['MYSQL_READ_TIMEOUT']
+    write_timeout = app.config['MYSQL_WRITE_TIMEOUT']
+    init_command = None
+
+    remaining = remaining_time()
+    if remaining is not None:
+        if remaining <= 0:
+            raise DeadlineExceeded()
+        # El socket y el servidor cortan el trabajo cuando se agota el presupuesto
+        connect_timeout = min(connect_timeout, remaining)
+        read_timeout = min(read_timeout, remaining)
+        write_timeout = min(write_timeout, remaining)
+        init_command = f"SET SESSION max_execution_time = {max(int(remaining * 1000), 1)}"
+
     try:
         connection = pymysql.connect(
             host=app.config['MYSQL_HOST'],
@@ -120,7 +426,11 @@ def get_db_connection():
             database=app.config['MYSQL_DB'],
             port=app.config['MYSQL_PORT'],
             charset='utf8mb4',
-            cursorclass=pymysql.cursors.DictCursor
+            cursorclass=pymysql.cursors.DictCursor,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            write_timeout=write_timeout,
+            init_command=init_command
         )
         return connection
     except Exception as e:
@@ -186,22 +496,10 @@ def init_database():
         return False
     
     try:
+        # Esquema versionado: tablas e índices se definen en migrations.py
+        migrate(connection)
+
         with connection.cursor() as cursor:
-            # Crear tabla de productos
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS products (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    name VARCHAR(255) NOT NULL,
-                    price DECIMAL(10, 2) NOT NULL,
-                    stock INT NOT NULL DEFAULT 0,
-                    description TEXT,
-                    category VARCHAR(100),
-                    image_url VARCHAR(500),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-                )
-            """)
-            
             # Verificar si hay productos
             cursor.execute("SELECT COUNT(*) as count FROM products")
             result = cursor.fetchone()
@@ -234,25 +532,299 @@ def init_database():
     finally:
         connection.close()
 
+# --- Arranque en caliente del catálogo ---
+def catalog_stamp(cursor):
+    """Huella actual de products (ver CATALOG_STAMP_SQL) en forma serializable"""
+    cursor.execute(CATALOG_STAMP_SQL)
+    row = cursor.fetchone()
+    return {
+        'count': int(row['count']),
+        'version_sum': int(row['version_sum']),
+        'max_id': row['max_id'],
+        'updated_at': row['updated_at'].isoformat() if row['updated_at'] else None
+    }
+
+CATALOG_SNAPSHOT_LOCK = 'catalog_snapshot'
+
+def warm_start_catalog():
+    """Carga el snapshot del catálogo y lo pone al día con MySQL.
+
+    Si el stamp del snapshot coincide con el de la tabla se usa tal cual; si
+    no, se comparan las versiones por id y solo se releen las filas que
+    cambiaron. Sin snapshot previo se construye uno en streaming.
+
+    La construcción se serializa entre workers con GET_LOCK: uno escribe la
+    generación y el resto, al obtener el lock, relee el puntero, encuentra el
+    stamp al día y solo la mapea.
+    """
+    if not app.config['CATALOG_SNAPSHOT_ENABLED']:
+        return False
+    path = app.config['CATALOG_SNAPSHOT_PATH']
+    connection = get_db_connection()
+    if not connection:
+        return False
+
+    # Las invalidaciones que lleguen desde aquí pueden no estar en la generación: se conservan
+    marker = catalog_snapshot.marker()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT GET_LOCK(%s, %s) AS acquired",
+                           (CATALOG_SNAPSHOT_LOCK, app.config['CATALOG_SNAPSHOT_LOCK_TIMEOUT']))
+            row = cursor.fetchone()
+        if not row or row['acquired'] != 1:
+            print("⚠️ Otro worker sigue construyendo el snapshot del catálogo, se reintentará")
+            return False
+        try:
+            _build_catalog_snapshot(connection, path)
+            return catalog_snapshot.load(since=marker)
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (CATALOG_SNAPSHOT_LOCK,))
+                cursor.fetchone()
+    except Exception as e:
+        print(f"❌ Error preparando el snapshot del catálogo: {e}")
+        return False
+    finally:
+        connection.close()
+
+def _build_catalog_snapshot(connection, path):
+    """Escribe una generación nueva si la vigente no coincide con el stamp de MySQL (con el lock tomado)"""
+    # El stamp se lee antes que las filas: el snapshot nunca queda más viejo que su stamp
+    with connection.cursor() as cursor:
+        stamp = catalog_stamp(cursor)
+
+    # La generación anterior se lee y se cierra antes de escribir la nueva
+    previous = CatalogSnapshot(path)
+    try:
+        previous_stamp = previous.stamp if previous.load() else None
+        old_products = previous.load_all() if previous_stamp and previous_stamp != stamp else None
+    finally:
+        previous.close()
+
+    if previous_stamp == stamp:
+        print(f"✅ Snapshot del catálogo al día ({stamp['count']} productos)")
+        return
+
+    if old_products is not None:
+        # updated_at solo cubre escrituras hechas fuera de la API que no incrementan version
+        since = datetime.fromisoformat(previous_stamp['updated_at']) if previous_stamp['updated_at'] else None
+        products = {p['id']: p for p in old_products}
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT id, version, updated_at FROM products")
+            live = cursor.fetchall()
+            changed_ids = [
+                row['id'] for row in live
+                if row['id'] not in products or products[row['id']].get('version') != row['version']
+                or (since and row['updated_at'] and row['updated_at'] >= since)
+            ]
+            batch_size = app.config['PRODUCT_BATCH_MAX_IDS']
+            for start in range(0, len(changed_ids), batch_size):
+                batch = changed_ids[start:start + batch_size]
+                cursor.execute(f"SELECT * FROM products WHERE id IN ({', '.join(['%s'] * len(batch))})", batch)
+                for row in cursor.fetchall():
+                    products[row['id']] = serialize_product(row)
+        live_ids = {row['id'] for row in live}
+        products = [p for p in products.values() if p['id'] in live_ids]
+        products.sort(key=lambda p: p['created_at'] or '', reverse=True)
+        write_snapshot(path, ((p['id'], json.dumps(p)) for p in products), stamp)
+        print(f"✅ Snapshot del catálogo puesto al día ({len(changed_ids)} filas cambiadas)")
+    else:
+        cursor = connection.cursor(pymysql.cursors.SSCursor)
+        try:
+            cursor.execute(LIST_PRODUCTS_SQL)
+            columns = [col[0] for col in cursor.description]
+            id_index = columns.index('id')
+            count = write_snapshot(path, (
+                (row[id_index], json.dumps(dict(zip(columns, map(_json_value, row)))))
+                for row in cursor
+            ), stamp)
+        finally:
+            cursor.close()
+        print(f"✅ Snapshot del catálogo creado ({count} productos)")
+
+def refresh_catalog_snapshot():
+    """Compara el stamp con MySQL y, si cambió, pone el snapshot al día y mapea la generación nueva.
+
+    Corre en un hilo propio, fuera de cualquier solicitud y su deadline. Si
+    MySQL no responde el estado queda como estaba y se reintenta en el
+    siguiente intervalo.
+    """
+    connection = get_db_connection()
+    if not connection:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            stamp = catalog_stamp(cursor)
+    except Exception as e:
+        print(f"❌ Error revalidando el snapshot del catálogo: {e}")
+        return None
+    finally:
+        connection.close()
+    if stamp == catalog_snapshot.stamp and catalog_snapshot.is_clean:
+        return True
+    return warm_start_catalog()
+
+def _catalog_refresh_loop():
+    while True:
+        time.sleep(app.config['CATALOG_SNAPSHOT_REVALIDATE_SECONDS'])
+        try:
+            refresh_catalog_snapshot()
+        except Exception as e:
+            print(f"❌ Error revalidando el snapshot del catálogo: {e}")
+
+# --- Trabajos en segundo plano ---
+job_runner = JobRunner(get_db_connection,
+                       max_workers=app.config['JOB_WORKERS'],
+                       max_pending=app.config['JOB_MAX_PENDING'],
+                       heartbeat_interval=app.config['JOB_HEARTBEAT_SECONDS'])
+
+def reseed_job(ctx):
+    """Vuelve a sembrar el catálogo; con reset=true borra antes los productos"""
+    if ctx.params.get('reset'):
+        connection = get_db_connection()
+        if not connection:
+            raise RuntimeError('Error de conexión a la base de datos')
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("DELETE FROM products")
+            connection.commit()
+        finally:
+            connection.close()
+        ctx.progress(50)
+    if not init_database():
+        raise RuntimeError('No se pudo inicializar la base de datos')
+    cache_bus.publish()
+    return {'reset': bool(ctx.params.get('reset'))}
+
+def bulk_price_update_job(ctx):
+    """Ajusta precios en porcentaje (opcionalmente por categoría), por lotes"""
+    percent = float(ctx.params['percent'])
+    category = ctx.params.get('category')
+    batch_size = app.config['JOB_BATCH_SIZE']
+
+    connection = get_db_connection()
+    if not connection:
+        raise RuntimeError('Error de conexión a la base de datos')
+    try:
+        with connection.cursor() as cursor:
+            if category:
+                cursor.execute(PRODUCTS_BY_CATEGORY_SQL, (category,))
+            else:
+                cursor.execute("SELECT id FROM products ORDER BY id")
+            ids = [row['id'] for row in cursor.fetchall()]
+
+            updated = 0
+            for start in range(0, len(ids), batch_size):
+                batch = ids[start:start + batch_size]
+                placeholders = ', '.join(['%s'] * len(batch))
+                cursor.execute(
+                    f"UPDATE products SET price = GREATEST(ROUND(price * (1 + %s / 100), 2), 0), version = version + 1 "
+                    f"WHERE id IN ({placeholders})",
+                    (percent, *batch)
+                )
+                connection.commit()
+                updated += len(batch)
+                cache_bus.publish(*[product_cache_key(product_id) for product_id in batch])
+                ctx.progress(updated * 100 / len(ids))
+    finally:
+        connection.close()
+    return {'updated': updated, 'percent': percent, 'category': category}
+
+def analyze_products_job(ctx):
+    """Recalcula las estadísticas de índices de la tabla products"""
+    connection = get_db_connection()
+    if not connection:
+        raise RuntimeError('Error de conexión a la base de datos')
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE TABLE products")
+            result = cursor.fetchall()
+    finally:
+        connection.close()
+    return {'analyze': [row.get('Msg_text') for row in result]}
+
+job_runner.register('reseed', reseed_job, limit=1)
+job_runner.register('bulk_price_update', bulk_price_update_job, limit=1)
+job_runner.register('analyze_products', analyze_products_job, limit=1)
+
 # --- Recursos de la API ---
 class ProductListResource(Resource):
     def get(self):
-        """Obtener todos los productos - No requiere autenticación"""
+        """Obtener todos los productos, o solo los de ?ids=1,2,3 - No requiere autenticación"""
+        if 'ids' in request.args:
+            return self._get_by_ids(request.args.get('ids', ''))
+
+        if catalog_snapshot.is_clean:
+            # Ninguna escritura desde el arranque: el catálogo sale tal cual del snapshot
+            return Response(stream_with_deadline(catalog_snapshot.iter_list_json()),
+                            status=200, mimetype='application/json')
+
         connection = get_db_connection()
         if not connection:
             return {'success': False, 'message': 'Error de conexión a la base de datos'}, 500
 
         try:
-            with connection.cursor() as cursor:
-                cursor.execute("SELECT * FROM products ORDER BY created_at DESC")
-                products = cursor.fetchall()
-                products = serialize_product(products)
-                return {'success': True, 'data': products, 'count': len(products)}, 200
+            # Cursor sin buffer: las filas (tuplas) se leen del socket a medida que se codifican
+            cursor = connection.cursor(pymysql.cursors.SSCursor)
+            cursor.execute(LIST_PRODUCTS_SQL)
+            columns = [col[0] for col in cursor.description]
         except Exception as e:
+            connection.close()
             print(f"Error en GET /api/products: {e}")
             return {'success': False, 'message': str(e)}, 500
-        finally:
-            connection.close()
+
+        def generate():
+            try:
+                yield from iter_products_json(columns, cursor)
+            finally:
+                cursor.close()
+                connection.close()
+
+        return Response(stream_with_deadline(generate()), status=200, mimetype='application/json')
+
+    def _get_by_ids(self, raw_ids):
+        """Lectura por lote: caché por id primero y un solo WHERE id IN (...) para el resto"""
+        try:
+            ids = [int(value) for value in raw_ids.split(',') if value.strip()]
+        except ValueError:
+            return {'success': False, 'message': 'El parámetro ids debe ser una lista de enteros separados por comas'}, 400
+
+        ids = list(dict.fromkeys(ids))  # Sin duplicados, conservando el orden
+        if not ids:
+            return {'success': False, 'message': 'Se requiere al menos un id'}, 400
+        max_ids = app.config['PRODUCT_BATCH_MAX_IDS']
+        if len(ids) > max_ids:
+            return {'success': False, 'message': f'Máximo {max_ids} ids por solicitud'}, 400
+
+        found = {}
+        for product_id in ids:
+            cached = get_cached_product(product_id)
+            if cached:
+                found[product_id] = cached
+
+        pending = [product_id for product_id in ids if product_id not in found]
+        if pending:
+            epoch = product_cache.epoch
+            connection = get_db_connection()
+            if not connection:
+                return {'success': False, 'message': 'Error de conexión a la base de datos'}, 500
+            try:
+                with connection.cursor() as cursor:
+                    placeholders = ', '.join(['%s'] * len(pending))
+                    cursor.execute(f"SELECT * FROM products WHERE id IN ({placeholders})", tuple(pending))
+                    for product in cursor.fetchall():
+                        product = serialize_product(product)
+                        found[product['id']] = product
+                        product_cache.set(product_cache_key(product['id']), product, epoch)
+            except Exception as e:
+                print(f"Error en GET /api/products?ids=: {e}")
+                return {'success': False, 'message': str(e)}, 500
+            finally:
+                connection.close()
+
+        products = [found[product_id] for product_id in ids if product_id in found]
+        missing = [product_id for product_id in ids if product_id not in found]
+        return {'success': True, 'data': products, 'count': len(products), 'missing': missing}, 200
 
     @token_required
     @admin_required
@@ -285,6 +857,7 @@ class ProductListResource(Resource):
                 ))
                 product_id = cursor.lastrowid
                 connection.commit()
+                cache_bus.publish(product_cache_key(product_id))
 
                 cursor.execute("SELECT * FROM products WHERE id = %s", (product_id,))
                 new_product = cursor.fetchone()
@@ -305,6 +878,11 @@ class ProductListResource(Resource):
 class ProductResource(Resource):
     def get(self, id):
         """Obtener producto por ID - No requiere autenticación"""
+        cached = get_cached_product(id)
+        if cached:
+            return {'success': True, 'data': cached}, 200, {'ETag': product_etag(cached)}
+
+        epoch = product_cache.epoch
         connection = get_db_connection()
         if not connection:
             return {'success': False, 'message': 'Error de conexión a la base de datos'}, 500
@@ -316,7 +894,8 @@ class ProductResource(Resource):
                     return {'success': False, 'message': 'Producto no encontrado'}, 404
                 
                 product = serialize_product(product)
-                return {'success': True, 'data': product}
+                product_cache.set(product_cache_key(id), product, epoch)
+                return {'success': True, 'data': product}, 200, {'ETag': product_etag(product)}
         except Exception as e:
             print(f"Error en GET /api/products/<id>: {e}")
             return {'success': False, 'message': str(e)}, 500
@@ -335,32 +914,47 @@ class ProductResource(Resource):
         connection = get_db_connection()
         if not connection:
             return {'success': False, 'message': 'Error de conexión a la base de datos'}, 500
+        expected_versions = parse_if_match()
         try:
             with connection.cursor() as cursor:
-                cursor.execute("SELECT id FROM products WHERE id = %s", (id,))
-                if not cursor.fetchone():
-                    return {'success': False, 'message': 'Producto no encontrado'}, 404
-                
                 set_clauses = []
                 values = []
                 for key, value in product_data.items():
-                    if key not in ['id', 'created_at', 'updated_at']:
+                    if key not in ['id', 'created_at', 'updated_at', 'version']:
                         set_clauses.append(f"{key} = %s")
                         values.append(value)
                 
                 if not set_clauses:
                     return {'success': False, 'message': 'No se proporcionaron campos para actualizar'}, 400
                 
-                query = f"UPDATE products SET {', '.join(set_clauses)} WHERE id = %s"
+                # Compare-and-swap: con If-Match solo se escribe si la versión no cambió
+                query = f"UPDATE products SET {', '.join(set_clauses)}, version = version + 1 WHERE id = %s"
                 values.append(id)
+                if expected_versions is not None:
+                    condition, versions = version_condition(expected_versions)
+                    query += condition
+                    values.extend(versions)
                 cursor.execute(query, tuple(values))
+
+                if cursor.rowcount == 0:
+                    # version + 1 siempre modifica la fila: 0 filas es inexistente o conflicto
+                    cursor.execute("SELECT id FROM products WHERE id = %s", (id,))
+                    if not cursor.fetchone():
+                        return {'success': False, 'message': 'Producto no encontrado'}, 404
+                    return PRECONDITION_FAILED
+
                 connection.commit()
+                cache_bus.publish(product_cache_key(id))
 
                 cursor.execute("SELECT * FROM products WHERE id = %s", (id,))
                 updated_product = cursor.fetchone()
                 updated_product = serialize_product(updated_product)
 
-                return {'success': True, 'message': 'Producto actualizado exitosamente', 'data': updated_product}
+                return {
+                    'success': True,
+                    'message': 'Producto actualizado exitosamente',
+                    'data': updated_product
+                }, 200, {'ETag': product_etag(updated_product)}
         except Exception as e:
             connection.rollback()
             print(f"Error en PUT /api/products/<id>: {e}")
@@ -368,6 +962,82 @@ class ProductResource(Resource):
         finally:
             connection.close()
 
+    @token_required
+    @admin_required
+    def patch(self, current_user, id):
+        """Actualizar parcialmente un producto, escribiendo solo las columnas que cambian - Requiere admin"""
+        try:
+            changes = product_patch_schema.load(request.json or {})
+        except ValidationError as err:
+            return {'success': False, 'message': 'Datos inválidos', 'errors': err.messages}, 400
+
+        if not changes:
+            return {'success': False, 'message': 'No se proporcionaron campos para actualizar'}, 400
+
+        connection = get_db_connection()
+        if not connection:
+            return {'success': False, 'message': 'Error de conexión a la base de datos'}, 500
+        try:
+            expected_versions = parse_if_match()
+            with connection.cursor() as cursor:
+                # Un segundo intento si otra escritura gana la carrera entre la lectura y el UPDATE
+                for _ in range(PATCH_ATTEMPTS):
+                    cursor.execute("SELECT * FROM products WHERE id = %s", (id,))
+                    product = cursor.fetchone()
+                    if not product:
+                        return {'success': False, 'message': 'Producto no encontrado'}, 404
+
+                    if expected_versions is not None and product['version'] not in expected_versions:
+                        return PRECONDITION_FAILED
+
+                    diff = diff_product_changes(product, changes)
+                    if not diff:
+                        # Nada cambió: no se escribe en la base de datos
+                        product = serialize_product(product)
+                        return {'success': True, 'message': 'Sin cambios', 'data': product}, 200, {'ETag': product_etag(product)}
+
+                    # El diff se calculó sobre la versión leída: compare-and-swap contra ella.
+                    # updated_at lo fija MySQL (ON UPDATE CURRENT_TIMESTAMP) con su propio reloj
+                    set_clauses = [f"{key} = %s" for key in diff]
+                    values = list(diff.values()) + [id, product['version']]
+                    cursor.execute(
+                        f"UPDATE products SET {', '.join(set_clauses)}, version = version + 1 WHERE id = %s AND version = %s",
+                        tuple(values)
+                    )
+                    if cursor.rowcount == 1:
+                        break
+                    # Nueva transacción para que la relectura vea la fila actual
+                    connection.rollback()
+                else:
+                    if expected_versions is not None:
+                        return PRECONDITION_FAILED
+                    return {
+                        'success': False,
+                        'message': 'El producto se está modificando concurrentemente. Intenta de nuevo',
+                        'code': 'CONCURRENT_UPDATE'
+                    }, 409
+
+                connection.commit()
+                cache_bus.publish(product_cache_key(id))
+
+                # Sin relectura: la respuesta omite updated_at, que solo conoce MySQL
+                product.update(diff)
+                product['version'] += 1
+                product.pop('updated_at', None)
+                product = serialize_product(product)
+                return {
+                    'success': True,
+                    'message': 'Producto actualizado exitosamente',
+                    'data': product,
+                    'updated_fields': list(diff)
+                }, 200, {'ETag': product_etag(product)}
+        except Exception as e:
+            connection.rollback()
+            print(f"Error en PATCH /api/products/<id>: {e}")
+            return {'success': False, 'message': str(e)}, 500
+        finally:
+            connection.close()
+
     @token_required
     @admin_required
     def delete(self, current_user, id):
@@ -377,10 +1047,20 @@ class ProductResource(Resource):
             return {'success': False, 'message': 'Error de conexión a la base de datos'}, 500
         try:
             with connection.cursor() as cursor:
-                cursor.execute("DELETE FROM products WHERE id = %s", (id,))
+                expected_versions = parse_if_match()
+                if expected_versions is None:
+                    cursor.execute("DELETE FROM products WHERE id = %s", (id,))
+                else:
+                    condition, versions = version_condition(expected_versions)
+                    cursor.execute("DELETE FROM products WHERE id = %s" + condition, (id, *versions))
                 if cursor.rowcount == 0:
+                    if expected_versions is not None:
+                        cursor.execute("SELECT id FROM products WHERE id = %s", (id,))
+                        if cursor.fetchone():
+                            return PRECONDITION_FAILED
                     return {'success': False, 'message': 'Producto no encontrado'}, 404
                 connection.commit()
+                cache_bus.publish(product_cache_key(id))
                 return {'success': True, 'message': 'Producto eliminado exitosamente'}, 200
         except Exception as e:
             connection.rollback()
@@ -389,6 +1069,34 @@ class ProductResource(Resource):
         finally:
             connection.close()
 
+# Facetas de categorías para los filtros del cliente
+class ProductFacetsResource(Resource):
+    def get(self):
+        """Obtener categorías con conteos y rangos de precio - No requiere autenticación"""
+        connection = get_db_connection()
+        if not connection:
+            return {'success': False, 'message': 'Error de conexión a la base de datos'}, 500
+
+        try:
+            with connection.cursor() as cursor:
+                # Agregación resuelta solo con el índice cubriente (category, price, stock)
+                cursor.execute(PRODUCT_FACETS_SQL)
+                facets = []
+                for row in cursor.fetchall():
+                    facets.append({
+                        'category': row['category'],
+                        'count': int(row['count']),
+                        'in_stock': int(row['in_stock'] or 0),
+                        'min_price': float(row['min_price']) if row['min_price'] is not None else None,
+                        'max_price': float(row['max_price']) if row['max_price'] is not None else None
+                    })
+                return {'success': True, 'data': facets, 'count': len(facets)}, 200
+        except Exception as e:
+            print(f"Error en GET /api/products/facets: {e}")
+            return {'success': False, 'message': str(e)}, 500
+        finally:
+            connection.close()
+
 # Recurso para disminuir stock - VERSIÓN FINAL CORREGIDA
 class ProductDecreaseStockResource(Resource):
     @token_required
@@ -432,23 +1140,34 @@ class ProductDecreaseStockResource(Resource):
                         'message': f'Stock insuficiente. Disponible: {product["stock"]}, Solicitado: {quantity}'
                     }, 400
 
-                # Actualizar el stock
-                new_stock = product['stock'] - quantity
-                cursor.execute("UPDATE products SET stock = %s WHERE id = %s", (new_stock, id))
+                # Actualizar el stock de forma atómica: otra venta concurrente no puede dejarlo negativo
+                cursor.execute(
+                    "UPDATE products SET stock = stock - %s, version = version + 1 WHERE id = %s AND stock >= %s",
+                    (quantity, id, quantity)
+                )
+                if cursor.rowcount == 0:
+                    connection.rollback()
+                    print(f"❌ Stock insuficiente tras una venta concurrente del producto {id}")
+                    return {
+                        'success': False,
+                        'message': f'Stock insuficiente. Solicitado: {quantity}'
+                    }, 400
                 connection.commit()
-                
-                print(f"✅ Stock actualizado: {product['stock']} → {new_stock}")
+                cache_bus.publish(product_cache_key(id))
                 
                 # Obtener el producto actualizado
                 cursor.execute("SELECT * FROM products WHERE id = %s", (id,))
                 updated_product = cursor.fetchone()
                 updated_product = serialize_product(updated_product)
+                new_stock = updated_product['stock']
+
+                print(f"✅ Stock actualizado: {product['stock']} → {new_stock}")
                 
                 return {
                     'success': True,
                     'data': updated_product,
                     'message': f'Stock disminuido en {quantity} unidades. Nuevo stock: {new_stock}'
-                }, 200
+                }, 200, {'ETag': product_etag(updated_product)}
                 
         except Exception as e:
             connection.rollback()
@@ -457,6 +1176,61 @@ class ProductDecreaseStockResource(Resource):
         finally:
             connection.close()
 
+# Trabajos de administración en segundo plano
+class JobListResource(Resource):
+    @token_required
+    @admin_required
+    def get(self, current_user):
+        """Listar los trabajos más recientes - Requiere admin"""
+        jobs = job_runner.list()
+        return {'success': True, 'data': jobs, 'count': len(jobs), 'types': job_runner.job_types}
+
+    @token_required
+    @admin_required
+    def post(self, current_user):
+        """Encolar un trabajo pesado - Requiere admin. Responde 202 sin esperar a que termine"""
+        data = request.get_json() or {}
+        job_type = data.get('type')
+        params = data.get('params') or {}
+
+        if job_type not in job_runner.job_types:
+            return {'success': False, 'message': f'Tipo de trabajo inválido. Tipos: {", ".join(job_runner.job_types)}'}, 400
+        if job_type == 'bulk_price_update' and not isinstance(params.get('percent'), (int, float)):
+            return {'success': False, 'message': 'bulk_price_update requiere params.percent numérico'}, 400
+
+        try:
+            job_id = job_runner.submit(job_type, params, created_by=current_user.get('email'))
+        except JobQueueFull as e:
+            return {'success': False, 'message': str(e)}, 503
+        except Exception as e:
+            print(f"Error en POST /api/admin/jobs: {e}")
+            return {'success': False, 'message': str(e)}, 500
+
+        return {
+            'success': True,
+            'message': 'Trabajo encolado',
+            'data': job_runner.get(job_id)
+        }, 202, {'Location': f'/api/admin/jobs/{job_id}'}
+
+class JobResource(Resource):
+    @token_required
+    @admin_required
+    def get(self, current_user, job_id):
+        """Consultar estado y progreso de un trabajo - Requiere admin"""
+        job = job_runner.get(job_id)
+        if not job:
+            return {'success': False, 'message': 'Trabajo no encontrado'}, 404
+        return {'success': True, 'data': job}
+
+    @token_required
+    @admin_required
+    def delete(self, current_user, job_id):
+        """Cancelar un trabajo en cola o en ejecución - Requiere admin"""
+        job = job_runner.cancel(job_id)
+        if not job:
+            return {'success': False, 'message': 'Trabajo no encontrado'}, 404
+        return {'success': True, 'message': 'Cancelación solicitada', 'data': job}, 202
+
 # Ruta de salud
 @app.route('/health')
 def health_check():
@@ -476,14 +1250,35 @@ def debug_jwt():
         'jwt_secret_preview': JWT_SECRET[:10] + '...' if JWT_SECRET else None
     })
 
+# Ruta de debug para deadlines agotados por ruta
+@app.route('/debug/deadlines')
+def debug_deadlines():
+    with _deadline_lock:
+        counts = dict(deadline_exceeded_counts)
+    return jsonify({
+        'default_deadline_ms': app.config['REQUEST_DEADLINE_MS'],
+        'route_deadlines_ms': app.config['ROUTE_DEADLINES_MS'],
+        'deadline_exceeded': counts
+    })
+
 # Registrar recursos
 api.add_resource(ProductListResource, '/api/products')
+api.add_resource(ProductFacetsResource, '/api/products/facets')
 api.add_resource(ProductResource, '/api/products/<int:id>')
 api.add_resource(ProductDecreaseStockResource, '/api/products/<int:id>/decrease-stock')
+api.add_resource(JobListResource, '/api/admin/jobs')
+api.add_resource(JobResource, '/api/admin/jobs/<int:job_id>')
 
 # Inicializar la base de datos al arrancar
 with app.app_context():
-    init_database()
+    if init_database():
+        warm_start_catalog()
+
+# El latido arranca aunque MySQL no estuviera disponible: este worker igual acepta trabajos
+job_runner.start()
+if app.config['CATALOG_SNAPSHOT_ENABLED']:
+    # También sin MySQL al arrancar: el primer intervalo construye o mapea el snapshot
+    threading.Thread(target=_catalog_refresh_loop, name='catalog-refresh', daemon=True).start()
 
 if __name__ == '__main__':
     print("🚀 Iniciando Backend 2 - Flask + MySQL (VERSIÓN FINAL)")
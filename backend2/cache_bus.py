@@ -0,0 +1,236 @@
+"""
+Bus de invalidación de caché entre workers de Backend 2
+
+Cada worker mantiene su propia caché en memoria. Cuando un worker escribe un
+producto publica un mensaje versionado (origen + número de secuencia) y el
+resto de workers aplica la invalidación al recibirlo. Si un worker detecta un
+hueco en la secuencia de un origen, asume que perdió mensajes y vacía su caché.
+"""
+import os
+import glob
+import json
+import errno
+import time
+import uuid
+import socket
+import tempfile
+import threading
+
+# Claves por mensaje: mantiene cada datagrama muy por debajo del límite de 64 KB
+MAX_KEYS_PER_MESSAGE = 500
+
+
+# --- Caché local por proceso ---
+class LocalCache:
+    """Caché en memoria con TTL y una época que avanza con cada invalidación."""
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._data = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    @property
+    def epoch(self):
+        return self._epoch
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if not entry:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, epoch=None):
+        """Guarda el valor salvo que haya habido una invalidación desde `epoch`.
+
+        Evita cachear un valor leído de la base de datos antes de que llegara
+        la invalidación de otro worker.
+        """
+        with self._lock:
+            if epoch is not None and epoch != self._epoch:
+                return False
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            return True
+
+    def invalidate(self, keys=None):
+        """Elimina las claves indicadas, o toda la caché si `keys` es None."""
+        with self._lock:
+            self._epoch += 1
+            if keys is None:
+                self._data.clear()
+            else:
+                for key in keys:
+                    self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+# --- Transportes ---
+class LocalTransport:
+    """Transporte en el mismo proceso: todos los buses del hub reciben los mensajes."""
+
+    def __init__(self, hub=None):
+        self.hub = hub if hub is not None else []
+        self._receiver = None
+
+    def start(self, origin, receiver):
+        self._receiver = receiver
+        self.hub.append(self)
+
+    def send(self, payload):
+        for transport in list(self.hub):
+            if transport is not self and transport._receiver:
+                transport._receiver(payload)
+
+    def close(self):
+        if self in self.hub:
+            self.hub.remove(self)
+
+
+class UnixSocketTransport:
+    """Transporte IPC con sockets Unix de datagramas, uno por worker en un directorio compartido."""
+
+    def __init__(self, directory=None):
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'backend2-cache-bus')
+        self.path = None
+        self._sock = None
+        self._thread = None
+
+    def start(self, origin, receiver):
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, f"{origin}.sock")
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(self.path)
+        self._thread = threading.Thread(target=self._listen, args=(receiver,), daemon=True)
+        self._thread.start()
+
+    def _listen(self, receiver):
+        while True:
+            try:
+                payload = self._sock.recv(65536)
+            except OSError:
+                return
+            try:
+                receiver(payload)
+            except Exception as e:
+                print(f"❌ Error aplicando invalidación: {e}")
+
+    def send(self, payload):
+        """Envía sin bloquear: si un worker no lee, su mensaje se descarta.
+
+        El receptor detecta el hueco en la secuencia y vacía su caché, así que
+        un worker detenido nunca frena las escrituras del resto.
+        """
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sender:
+            sender.setblocking(False)
+            for peer in glob.glob(os.path.join(self.directory, '*.sock')):
+                if peer == self.path:
+                    continue
+                try:
+                    sender.sendto(payload, peer)
+                except BlockingIOError:
+                    print(f"⚠️ Cola llena en {peer}, invalidación descartada")
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # Socket de un worker que ya terminó
+                    try:
+                        os.unlink(peer)
+                    except OSError:
+                        pass
+                except OSError as e:
+                    if e.errno == errno.EMSGSIZE:
+                        print(f"⚠️ Invalidación demasiado grande para {peer}, descartada")
+                    else:
+                        print(f"❌ Error enviando invalidación a {peer}: {e}")
+
+    def close(self):
+        if self._sock:
+            self._sock.close()
+            self._sock = None
+        if self.path and os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+# --- Bus de invalidación ---
+class InvalidationBus:
+    """Publica y aplica invalidaciones versionadas sobre las cachés registradas."""
+
+    def __init__(self, transport, origin=None):
+        self.transport = transport
+        self.origin = origin or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.missed = 0
+        self._seq = 0
+        self._seen = {}
+        self._caches = []
+        self._lock = threading.Lock()
+
+    def attach(self, cache):
+        self._caches.append(cache)
+        return cache
+
+    def start(self):
+        self.transport.start(self.origin, self._receive)
+        return self
+
+    def close(self):
+        self.transport.close()
+
+    def publish(self, *keys):
+        """Invalida las claves en este worker y notifica al resto. Sin claves vacía toda la caché.
+
+        Las listas largas se parten en varios mensajes, cada uno con su número de secuencia.
+        """
+        keys = list(keys) or None
+        self._apply(keys)
+        chunks = [None] if keys is None else [
+            keys[start:start + MAX_KEYS_PER_MESSAGE] for start in range(0, len(keys), MAX_KEYS_PER_MESSAGE)
+        ]
+        # El envío ocurre bajo el lock para que los mensajes salgan en orden de secuencia
+        with self._lock:
+            for chunk in chunks:
+                self._seq += 1
+                payload = json.dumps({'origin': self.origin, 'seq': self._seq, 'keys': chunk})
+                self.transport.send(payload.encode('utf-8'))
+            return self._seq
+
+    def _receive(self, payload):
+        message = json.loads(payload)
+        origin, seq = message['origin'], message['seq']
+        if origin == self.origin:
+            return
+
+        with self._lock:
+            last = self._seen.get(origin)
+            if last is not None and seq <= last:
+                return  # Duplicado o desordenado: ya aplicado
+            self._seen[origin] = seq
+            gap = last is not None and seq != last + 1
+
+        if gap:
+            # Se perdieron mensajes de este origen: no sabemos qué claves vaciar
+            self.missed += seq - last - 1
+            print(f"⚠️ Invalidaciones perdidas de {origin} ({last} → {seq}), vaciando caché")
+            self._apply(None)
+        else:
+            self._apply(message['keys'])
+
+    def _apply(self, keys):
+        for cache in self._caches:
+            cache.invalidate(keys)
+
+
+def create_transport(kind=None, directory=None):
+    """Crea el transporte configurado; en plataformas sin AF_UNIX usa el local."""
+    kind = kind or os.environ.get('CACHE_BUS_TRANSPORT') or ('unix' if hasattr(socket, 'AF_UNIX') else 'local')
+    if kind == 'unix':
+        return UnixSocketTransport(directory or os.environ.get('CACHE_BUS_DIR'))
+    if kind == 'local':
+        return LocalTransport()
+    raise ValueError(f"Transporte de invalidación desconocido: {kind}")
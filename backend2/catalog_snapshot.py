@@ -0,0 +1,307 @@
+"""
+Snapshot del catálogo en disco para el arranque en caliente de los workers
+
+El catálogo serializado se guarda en un archivo versionado que cada worker
+mapea en memoria (mmap). Las páginas las comparte el sistema operativo entre
+procesos, así que un worker nuevo no necesita leer todo `products` de MySQL.
+
+Cada generación se escribe en un archivo de datos nuevo (`<path>.<id>.data`)
+y `path` es solo un puntero con el nombre de la generación vigente, que se
+reemplaza de forma atómica. Así nunca se reemplaza ni se borra un archivo que
+otro proceso tiene mapeado (en Windows eso falla): las generaciones viejas se
+borran cuando ya nadie las usa.
+
+Formato de los datos (enteros little-endian):
+    MAGIC (8 bytes) | largo del header (uint32) | header JSON
+    | índice: `count` entradas (id, offset, largo) uint32 ordenadas por id
+    | cuerpo: los productos en JSON separados por comas, en orden de la lista
+
+El header guarda el `stamp` de la tabla al construirlo (COUNT, SUM(version),
+MAX(id), MAX(updated_at)): cada escritura incrementa `version`, así que el
+snapshot está al día solo si el stamp actual es idéntico.
+"""
+import os
+import glob
+import json
+import mmap
+import shutil
+import struct
+import tempfile
+import threading
+
+MAGIC = b'B2CATSN1'
+FORMAT_VERSION = 2
+_HEADER_LEN = struct.Struct('<I')
+_INDEX_ENTRY = struct.Struct('<III')
+_DATA_SUFFIX = '.data'
+
+
+def _data_files(path):
+    return glob.glob(glob.escape(os.path.abspath(path)) + '.*' + _DATA_SUFFIX)
+
+
+def _read_pointer(path):
+    """Ruta del archivo de datos vigente, o None si el puntero no existe o no es válido."""
+    try:
+        with open(path, 'rb') as f:
+            name = f.read(256).decode('utf-8', 'replace').strip()
+    except FileNotFoundError:
+        return None
+    if not name.endswith(_DATA_SUFFIX) or os.path.basename(name) != name:
+        return None
+    return os.path.join(os.path.dirname(os.path.abspath(path)), name)
+
+
+def _replace_file(directory, path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            out.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def remove_superseded(path):
+    """Borra las generaciones a las que ya no apunta `path`; las que siguen mapeadas se reintentan después."""
+    current = _read_pointer(path)
+    for data_path in _data_files(path):
+        if data_path == current:
+            continue
+        try:
+            os.unlink(data_path)
+        except OSError:
+            pass  # Windows: otro proceso todavía la tiene mapeada
+
+
+def write_snapshot(path, records, stamp):
+    """Escribe una generación nueva y la publica en el puntero. `records` son pares (id, json) en orden de la lista."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+
+    entries = []
+    with tempfile.TemporaryFile() as body:
+        offset = 0
+        for product_id, blob in records:
+            data = blob.encode('utf-8')
+            if entries:
+                body.write(b',')
+                offset += 1
+            body.write(data)
+            entries.append((product_id, offset, len(data)))
+            offset += len(data)
+        entries.sort()
+
+        header = json.dumps({
+            'format': FORMAT_VERSION,
+            'stamp': stamp,
+            'count': len(entries),
+            'body_size': offset
+        }).encode('utf-8')
+
+        fd, data_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + '.', suffix=_DATA_SUFFIX)
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                out.write(MAGIC)
+                out.write(_HEADER_LEN.pack(len(header)))
+                out.write(header)
+                for entry in entries:
+                    out.write(_INDEX_ENTRY.pack(*entry))
+                body.seek(0)
+                shutil.copyfileobj(body, out)
+            _replace_file(directory, path, os.path.basename(data_path).encode('utf-8'))
+        except Exception:
+            if os.path.exists(data_path):
+                os.unlink(data_path)
+            raise
+    remove_superseded(path)
+    return len(entries)
+
+
+class _Mapping:
+    """Una generación mapeada; se cierra cuando fue reemplazada y nadie la está leyendo."""
+
+    def __init__(self, mm, meta, index_start):
+        self.mm = mm
+        self.meta = meta
+        self.index_start = index_start
+        self.body_start = index_start + meta['count'] * _INDEX_ENTRY.size
+        self.refs = 0
+        self.retired = False
+
+
+class CatalogSnapshot:
+    """Vista de solo lectura sobre el snapshot mapeado en memoria.
+
+    Se registra en el bus de invalidación como una caché más: las claves
+    invalidadas dejan de servirse desde el snapshot y una invalidación total
+    lo desactiva. Cada invalidación lleva un número de orden; `load(since)`
+    olvida las anteriores a `since` porque la generación nueva ya las incluye.
+    """
+
+    def __init__(self, path, key=str):
+        self.path = path
+        self._key = key
+        self._current = None
+        self._seq = 0
+        self._stale = {}
+        self._disabled_seq = None
+        self._lock = threading.Lock()
+
+    def marker(self):
+        """Posición actual en la secuencia de invalidaciones, para pasarla luego a `load()`."""
+        with self._lock:
+            return self._seq
+
+    def load(self, since=None):
+        """Mapea la generación vigente; devuelve False si no existe o no es de este formato.
+
+        Con `since` (un `marker()` tomado antes de leer el stamp de MySQL) se
+        descartan las invalidaciones previas, que la generación ya refleja.
+        """
+        data_path = _read_pointer(self.path)
+        if data_path is None:
+            return False
+        try:
+            with open(data_path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size < len(MAGIC) + _HEADER_LEN.size:
+                    return False
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return False  # Otro worker publicó una generación nueva entre el puntero y la apertura
+        if mm[:len(MAGIC)] != MAGIC:
+            mm.close()
+            return False
+        (header_len,) = _HEADER_LEN.unpack_from(mm, len(MAGIC))
+        index_start = len(MAGIC) + _HEADER_LEN.size + header_len
+        meta = json.loads(mm[len(MAGIC) + _HEADER_LEN.size:index_start])
+        if meta.get('format') != FORMAT_VERSION:
+            mm.close()
+            return False
+
+        with self._lock:
+            previous, self._current = self._current, _Mapping(mm, meta, index_start)
+            if since is not None:
+                self._stale = {key: seq for key, seq in self._stale.items() if seq > since}
+                if self._disabled_seq is not None and self._disabled_seq <= since:
+                    self._disabled_seq = None
+            self._retire(previous)
+        return True
+
+    def close(self):
+        """Deja de servir el snapshot; el mapa se cierra cuando terminan las lecturas en curso."""
+        with self._lock:
+            previous, self._current = self._current, None
+            self._retire(previous)
+
+    def _retire(self, mapping):
+        # Se llama con self._lock tomado
+        if mapping is None:
+            return
+        mapping.retired = True
+        if mapping.refs == 0:
+            mapping.mm.close()
+
+    def _acquire(self):
+        with self._lock:
+            mapping = self._current
+            if mapping is not None:
+                mapping.refs += 1
+            return mapping
+
+    def _release(self, mapping):
+        with self._lock:
+            mapping.refs -= 1
+            if mapping.retired and mapping.refs == 0:
+                mapping.mm.close()
+
+    @property
+    def meta(self):
+        mapping = self._current
+        return mapping.meta if mapping else None
+
+    @property
+    def loaded(self):
+        return self._current is not None
+
+    @property
+    def stamp(self):
+        meta = self.meta
+        return meta['stamp'] if meta else None
+
+    @property
+    def count(self):
+        meta = self.meta
+        return meta['count'] if meta else 0
+
+    @property
+    def _disabled(self):
+        return self._disabled_seq is not None
+
+    @property
+    def is_clean(self):
+        """True si ninguna escritura lo invalidó desde la generación cargada."""
+        return self.loaded and not self._disabled and not self._stale
+
+    def invalidate(self, keys=None):
+        with self._lock:
+            self._seq += 1
+            if keys is None:
+                self._disabled_seq = self._seq
+            else:
+                for key in keys:
+                    self._stale[key] = self._seq
+
+    def get(self, product_id):
+        """Busca el producto por id (búsqueda binaria sobre el índice mapeado)."""
+        if self._disabled or self._key(product_id) in self._stale:
+            return None
+        mapping = self._acquire()
+        if mapping is None:
+            return None
+        try:
+            mm = mapping.mm
+            low, high = 0, mapping.meta['count'] - 1
+            while low <= high:
+                middle = (low + high) // 2
+                entry_id, offset, length = _INDEX_ENTRY.unpack_from(mm, mapping.index_start + middle * _INDEX_ENTRY.size)
+                if entry_id == product_id:
+                    start = mapping.body_start + offset
+                    return json.loads(mm[start:start + length])
+                if entry_id < product_id:
+                    low = middle + 1
+                else:
+                    high = middle - 1
+            return None
+        finally:
+            self._release(mapping)
+
+    def load_all(self):
+        """Todos los productos en orden de la lista (para la puesta al día incremental)."""
+        mapping = self._acquire()
+        if mapping is None:
+            return []
+        try:
+            start = mapping.body_start
+            return json.loads(b'[' + mapping.mm[start:start + mapping.meta['body_size']] + b']')
+        finally:
+            self._release(mapping)
+
+    def iter_list_json(self, chunk_size=64 * 1024):
+        """Respuesta de la lista copiando el cuerpo ya serializado directo desde el mapa.
+
+        La generación queda retenida hasta que termina (o se cierra) el streaming.
+        """
+        mapping = self._acquire()
+        if mapping is None:
+            raise RuntimeError('Snapshot del catálogo no cargado')
+        try:
+            yield b'{"success": true, "data": ['
+            end = mapping.body_start + mapping.meta['body_size']
+            for start in range(mapping.body_start, end, chunk_size):
+                yield mapping.mm[start:min(start + chunk_size, end)]
+            yield f'], "count": {mapping.meta["count"]}}}'.encode('utf-8')
+        finally:
+            self._release(mapping)
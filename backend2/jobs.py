@@ -0,0 +1,336 @@
+"""
+Ejecutor de trabajos en segundo plano para Backend 2
+
+Las operaciones pesadas de administración (re-seed, cambios masivos de precio,
+recálculo de estadísticas) se encolan aquí y corren en un pool acotado de
+hilos. El estado de cada trabajo se persiste en la tabla `jobs` (ver migrations.py) para poder
+consultarlo desde cualquier worker.
+
+El límite por tipo se aplica en la base de datos: un trabajo pasa a `running`
+solo si un UPDATE condicional (serializado con GET_LOCK por tipo) ve menos
+trabajos de ese tipo corriendo en todos los workers. Cada worker renueva
+`heartbeat_at` de sus trabajos; los que dejan de latir (worker caído) se
+marcan como fallidos.
+
+Las marcas de tiempo (started_at, heartbeat_at, finished_at) las pone MySQL
+con NOW(): la antigüedad del latido se juzga con el mismo reloj y zona horaria
+con que se escribió, aunque el servidor de la app esté en otra.
+"""
+import json
+import threading
+from collections import deque, Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+FINAL_STATUSES = ('succeeded', 'failed', 'cancelled')
+
+CLAIM_SQL = """
+    UPDATE jobs SET status = 'running', started_at = NOW(), heartbeat_at = NOW()
+    WHERE id = %s AND status = 'queued' AND cancel_requested = 0
+      AND (SELECT running FROM (
+              SELECT COUNT(*) AS running FROM jobs WHERE type = %s AND status = 'running'
+          ) AS active) < %s
+"""
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobContext:
+    """Lo que recibe cada handler: parámetros, progreso y cancelación cooperativa."""
+
+    def __init__(self, runner, job_id, job_type, params):
+        self.runner = runner
+        self.job_id = job_id
+        self.job_type = job_type
+        self.params = params
+        self._cancel = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise JobCancelled()
+
+    def progress(self, percent):
+        """Persiste el progreso y detecta cancelaciones pedidas desde otro worker."""
+        percent = max(0, min(100, int(percent)))
+        row = self.runner._execute(
+            "UPDATE jobs SET progress = %s WHERE id = %s", (percent, self.job_id),
+            fetch="SELECT cancel_requested FROM jobs WHERE id = %s", fetch_args=(self.job_id,)
+        )
+        if row and row['cancel_requested']:
+            self.cancel()
+        self.check_cancelled()
+
+
+class JobRunner:
+    """Pool acotado con límite de concurrencia por tipo de trabajo."""
+
+    def __init__(self, get_connection, max_workers=2, max_pending=50,
+                 heartbeat_interval=10, retry_interval=2):
+        self.get_connection = get_connection
+        self.max_pending = max_pending
+        self.heartbeat_interval = heartbeat_interval
+        self.retry_interval = retry_interval
+        self._stop = threading.Event()
+        self._heartbeat = None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._handlers = {}
+        self._limits = {}
+        self._running = Counter()
+        self._pending = {}
+        self._active = {}
+        self._lock = threading.Lock()
+
+    def register(self, job_type, handler, limit=1):
+        """Registra un handler `handler(ctx) -> dict` con su límite de concurrencia."""
+        self._handlers[job_type] = handler
+        self._limits[job_type] = limit
+        self._pending[job_type] = deque()
+
+    @property
+    def job_types(self):
+        return sorted(self._handlers)
+
+    # --- API pública ---
+    def start(self):
+        """Marca como fallidos los trabajos huérfanos y arranca el latido de este worker."""
+        self.recover_stale()
+        if self._heartbeat is None:
+            self._heartbeat = threading.Thread(target=self._beat, name='job-heartbeat', daemon=True)
+            self._heartbeat.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def recover_stale(self):
+        """Falla los trabajos en cola o corriendo cuyo worker dejó de renovar el latido."""
+        stale_after = self.heartbeat_interval * 3
+        count = self._execute(
+            "UPDATE jobs SET status = 'failed', error = %s, finished_at = NOW() "
+            "WHERE status IN ('queued', 'running') "
+            "AND COALESCE(heartbeat_at, created_at) < NOW() - INTERVAL %s SECOND",
+            ('Worker interrumpido antes de terminar el trabajo', stale_after),
+            rowcount=True
+        )
+        if count:
+            print(f"⚠️ {count} trabajo(s) huérfano(s) marcados como fallidos")
+        return count or 0
+
+    def submit(self, job_type, params=None, created_by=None):
+        if job_type not in self._handlers:
+            raise ValueError(f"Tipo de trabajo desconocido: {job_type}")
+        with self._lock:
+            pending = sum(len(queue) for queue in self._pending.values())
+            if pending >= self.max_pending:
+                raise JobQueueFull(f"Cola de trabajos llena ({self.max_pending})")
+
+        params = params or {}
+        job_id = self._execute(
+            "INSERT INTO jobs (type, status, params, created_by, heartbeat_at) VALUES (%s, 'queued', %s, %s, NOW())",
+            (job_type, json.dumps(params), created_by), lastrowid=True
+        )
+        if job_id is None:
+            raise RuntimeError('No se pudo registrar el trabajo en la base de datos')
+
+        ctx = JobContext(self, job_id, job_type, params)
+        with self._lock:
+            self._active[job_id] = ctx
+            self._pending[job_type].append(ctx)
+        self._dispatch(job_type)
+        return job_id
+
+    def cancel(self, job_id):
+        """Pide la cancelación; los trabajos en cola se cancelan de inmediato."""
+        job = self.get(job_id)
+        if not job:
+            return None
+        if job['status'] in FINAL_STATUSES:
+            return job
+
+        self._execute("UPDATE jobs SET cancel_requested = 1 WHERE id = %s", (job_id,))
+        with self._lock:
+            ctx = self._active.get(job_id)
+            queued = ctx is not None and ctx in self._pending[ctx.job_type]
+            if queued:
+                self._pending[ctx.job_type].remove(ctx)
+                del self._active[job_id]
+        if ctx:
+            ctx.cancel()
+        if queued:
+            self._set_status(job_id, 'cancelled', finished=True)
+        return self.get(job_id)
+
+    def get(self, job_id):
+        row = self._execute("SELECT * FROM jobs WHERE id = %s", (job_id,), fetch_only=True)
+        return self._row_to_job(row) if row else None
+
+    def list(self, limit=50):
+        rows = self._execute(
+            "SELECT * FROM jobs ORDER BY id DESC LIMIT %s", (limit,), fetch_only=True, fetch_all=True
+        )
+        return [self._row_to_job(row) for row in rows or []]
+
+    # --- Ejecución ---
+    def _dispatch(self, job_type):
+        with self._lock:
+            if self._running[job_type] >= self._limits[job_type] or not self._pending[job_type]:
+                return
+            ctx = self._pending[job_type].popleft()
+            self._running[job_type] += 1
+        self._executor.submit(self._run, ctx)
+
+    def _run(self, ctx):
+        claim = self._claim(ctx)
+        if claim == 'busy':
+            # Otro worker corre un trabajo del mismo tipo: vuelve al frente de la cola
+            with self._lock:
+                self._running[ctx.job_type] -= 1
+                self._pending[ctx.job_type].appendleft(ctx)
+            retry = threading.Timer(self.retry_interval, self._dispatch, (ctx.job_type,))
+            retry.daemon = True
+            retry.start()
+            return
+        if claim == 'gone':
+            with self._lock:
+                self._running[ctx.job_type] -= 1
+                self._active.pop(ctx.job_id, None)
+            self._dispatch(ctx.job_type)
+            return
+        try:
+            if claim == 'cancelled':
+                ctx.cancel()
+            elif claim != 'claimed':
+                raise RuntimeError('No se pudo reservar el trabajo en la base de datos')
+            ctx.check_cancelled()
+
+            print(f"⚙️ Trabajo {ctx.job_id} ({ctx.job_type}) iniciado")
+            result = self._handlers[ctx.job_type](ctx)
+            self._execute(
+                "UPDATE jobs SET status = 'succeeded', progress = 100, result = %s, finished_at = NOW() WHERE id = %s",
+                (json.dumps(result or {}), ctx.job_id)
+            )
+            print(f"✅ Trabajo {ctx.job_id} ({ctx.job_type}) completado")
+        except JobCancelled:
+            self._set_status(ctx.job_id, 'cancelled', finished=True)
+            print(f"🛑 Trabajo {ctx.job_id} ({ctx.job_type}) cancelado")
+        except Exception as e:
+            self._execute(
+                "UPDATE jobs SET status = 'failed', error = %s, finished_at = NOW() WHERE id = %s",
+                (str(e), ctx.job_id)
+            )
+            print(f"❌ Trabajo {ctx.job_id} ({ctx.job_type}) falló: {e}")
+        finally:
+            with self._lock:
+                self._running[ctx.job_type] -= 1
+                self._active.pop(ctx.job_id, None)
+            self._dispatch(ctx.job_type)
+
+    def _claim(self, ctx):
+        """Pasa el trabajo a `running` si el límite de su tipo lo permite en todos los workers.
+
+        Devuelve 'claimed', 'busy', 'cancelled', 'gone' (otro proceso ya lo cerró)
+        o None si la base de datos no respondió.
+        """
+        connection = self.get_connection()
+        if not connection:
+            print("❌ Sin conexión a la base de datos para la tabla jobs")
+            return None
+        lock_name = f"jobs:{ctx.job_type}"
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT GET_LOCK(%s, %s) AS acquired", (lock_name, self.retry_interval))
+                row = cursor.fetchone()
+                if not row or row['acquired'] != 1:
+                    return 'busy'
+                try:
+                    cursor.execute(CLAIM_SQL, (ctx.job_id, ctx.job_type, self._limits[ctx.job_type]))
+                    claimed = cursor.rowcount == 1
+                    connection.commit()
+                finally:
+                    cursor.execute("SELECT RELEASE_LOCK(%s)", (lock_name,))
+                    cursor.fetchone()
+                if claimed:
+                    return 'claimed'
+                cursor.execute("SELECT status, cancel_requested FROM jobs WHERE id = %s", (ctx.job_id,))
+                row = cursor.fetchone()
+                if not row or row['status'] != 'queued':
+                    return 'gone'
+                return 'cancelled' if row['cancel_requested'] else 'busy'
+        except Exception as e:
+            connection.rollback()
+            print(f"❌ Error en la tabla jobs: {e}")
+            return None
+        finally:
+            connection.close()
+
+    def _beat(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            with self._lock:
+                job_ids = list(self._active)
+            if job_ids:
+                placeholders = ', '.join(['%s'] * len(job_ids))
+                self._execute(f"UPDATE jobs SET heartbeat_at = NOW() WHERE id IN ({placeholders})",
+                              tuple(job_ids))
+            self.recover_stale()
+
+    def _set_status(self, job_id, status, finished=False):
+        clauses = ["status = %s"]
+        values = [status]
+        if finished:
+            clauses.append("finished_at = NOW()")
+        values.append(job_id)
+        self._execute(f"UPDATE jobs SET {', '.join(clauses)} WHERE id = %s", tuple(values))
+
+    def _execute(self, query, args=(), fetch=None, fetch_args=(), fetch_only=False,
+                 fetch_all=False, lastrowid=False, rowcount=False):
+        """Ejecuta una sentencia con su propia conexión corta."""
+        connection = self.get_connection()
+        if not connection:
+            print("❌ Sin conexión a la base de datos para la tabla jobs")
+            return None
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(query, args)
+                if fetch_only:
+                    return cursor.fetchall() if fetch_all else cursor.fetchone()
+                row_id = cursor.lastrowid
+                affected = cursor.rowcount
+                connection.commit()
+                if fetch:
+                    cursor.execute(fetch, fetch_args)
+                    return cursor.fetchone()
+                if rowcount:
+                    return affected
+                return row_id if lastrowid else None
+        except Exception as e:
+            connection.rollback()
+            print(f"❌ Error en la tabla jobs: {e}")
+            return None
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _row_to_job(row):
+        job = {}
+        for key, value in row.items():
+            if key in ('params', 'result'):
+                value = json.loads(value) if value else None
+            elif key == 'cancel_requested':
+                value = bool(value)
+            elif isinstance(value, datetime):
+                value = value.isoformat()
+            job[key] = value
+        return job
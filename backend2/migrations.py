@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Migraciones versionadas del esquema de Backend 2
+
+Cada migración tiene pasos `up` y `down` (SQL o funciones que reciben el
+cursor) y se registra en `schema_migrations` al aplicarse. Los índices se
+crean con ALGORITHM=INPLACE, LOCK=NONE para no bloquear escrituras.
+
+Uso:
+    python migrations.py status
+    python migrations.py up [versión]
+    python migrations.py down <versión>
+    python migrations.py explain
+"""
+import sys
+
+# Lock con nombre de MySQL: un solo proceso migra a la vez aunque arranquen varios workers
+MIGRATION_LOCK = 'schema_migrations'
+MIGRATION_LOCK_TIMEOUT = 60
+
+HISTORY_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+class Migration:
+    def __init__(self, version, name, up, down):
+        self.version = version
+        self.name = name
+        self.up = up
+        self.down = down
+
+
+def index_exists(cursor, table, index_name):
+    cursor.execute("""
+        SELECT COUNT(*) as count FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+    """, (table, index_name))
+    return cursor.fetchone()['count'] > 0
+
+
+def add_index(table, index_name, columns):
+    """Paso de migración: crea el índice en línea si no existe"""
+    def step(cursor):
+        if index_exists(cursor, table, index_name):
+            return
+        cursor.execute(
+            f"ALTER TABLE {table} ADD INDEX {index_name} ({', '.join(columns)}), ALGORITHM=INPLACE, LOCK=NONE"
+        )
+        print(f"✅ Índice {index_name} creado en {table}")
+    return step
+
+
+def column_exists(cursor, table, column):
+    cursor.execute("""
+        SELECT COUNT(*) as count FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+    """, (table, column))
+    return cursor.fetchone()['count'] > 0
+
+
+def add_column(table, column, definition):
+    """Paso de migración: agrega la columna en línea si no existe"""
+    def step(cursor):
+        if column_exists(cursor, table, column):
+            return
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}, ALGORITHM=INPLACE, LOCK=NONE")
+        print(f"✅ Columna {column} agregada a {table}")
+    return step
+
+
+def drop_column(table, column):
+    """Paso de migración: elimina la columna si existe"""
+    def step(cursor):
+        if column_exists(cursor, table, column):
+            cursor.execute(f"ALTER TABLE {table} DROP COLUMN {column}")
+    return step
+
+
+def drop_index(table, index_name):
+    """Paso de migración: elimina el índice si existe"""
+    def step(cursor):
+        if index_exists(cursor, table, index_name):
+            cursor.execute(f"ALTER TABLE {table} DROP INDEX {index_name}, ALGORITHM=INPLACE, LOCK=NONE")
+    return step
+
+
+MIGRATIONS = [
+    Migration(1, 'create_products', up=["""
+        CREATE TABLE IF NOT EXISTS products (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            price DECIMAL(10, 2) NOT NULL,
+            stock INT NOT NULL DEFAULT 0,
+            description TEXT,
+            category VARCHAR(100),
+            image_url VARCHAR(500),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+    """], down=["DROP TABLE IF EXISTS products"]),
+    Migration(2, 'create_jobs', up=["""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            type VARCHAR(50) NOT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'queued',
+            progress TINYINT UNSIGNED NOT NULL DEFAULT 0,
+            params TEXT,
+            result TEXT,
+            error TEXT,
+            cancel_requested TINYINT(1) NOT NULL DEFAULT 0,
+            created_by VARCHAR(255),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP NULL,
+            finished_at TIMESTAMP NULL,
+            INDEX idx_jobs_status (status)
+        )
+    """], down=["DROP TABLE IF EXISTS jobs"]),
+    Migration(3, 'index_products_created_at',
+              up=[add_index('products', 'idx_products_created_at', ['created_at'])],
+              down=[drop_index('products', 'idx_products_created_at')]),
+    Migration(4, 'index_products_category',
+              up=[add_index('products', 'idx_products_category', ['category'])],
+              down=[drop_index('products', 'idx_products_category')]),
+    Migration(5, 'index_products_updated_at',
+              up=[add_index('products', 'idx_products_updated_at', ['updated_at'])],
+              down=[drop_index('products', 'idx_products_updated_at')]),
+    Migration(6, 'index_products_category_price',
+              up=[add_index('products', 'idx_products_category_price', ['category', 'price'])],
+              down=[drop_index('products', 'idx_products_category_price')]),
+    Migration(7, 'add_products_version',
+              up=[add_column('products', 'version', 'INT UNSIGNED NOT NULL DEFAULT 1')],
+              down=[drop_column('products', 'version')]),
+    # Las facetas necesitan stock: índice cubriente que reemplaza al (category, price)
+    Migration(8, 'index_products_category_price_stock',
+              up=[add_index('products', 'idx_products_category_price_stock', ['category', 'price', 'stock']),
+                  drop_index('products', 'idx_products_category_price')],
+              down=[add_index('products', 'idx_products_category_price', ['category', 'price']),
+                    drop_index('products', 'idx_products_category_price_stock')]),
+    Migration(9, 'add_jobs_heartbeat',
+              up=[add_column('jobs', 'heartbeat_at', 'TIMESTAMP NULL')],
+              down=[drop_column('jobs', 'heartbeat_at')]),
+]
+
+
+def _run_steps(cursor, steps):
+    for step in steps:
+        if callable(step):
+            step(cursor)
+        else:
+            cursor.execute(step)
+
+
+def applied_versions(cursor):
+    cursor.execute(HISTORY_TABLE_SQL)
+    cursor.execute("SELECT version FROM schema_migrations ORDER BY version")
+    return [row['version'] for row in cursor.fetchall()]
+
+
+def migrate(connection, target=None):
+    """Lleva el esquema a la versión `target` (por defecto la última). Devuelve las versiones tocadas.
+
+    MySQL confirma el DDL implícitamente, así que cada migración se registra
+    en el historial en cuanto termina: si una falla, las anteriores quedan aplicadas.
+    Todo corre bajo GET_LOCK y el historial se lee ya con el lock tomado, así
+    que un worker que esperaba encuentra las migraciones del otro aplicadas.
+    """
+    if target is None:
+        target = MIGRATIONS[-1].version
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT GET_LOCK(%s, %s) AS acquired", (MIGRATION_LOCK, MIGRATION_LOCK_TIMEOUT))
+        row = cursor.fetchone()
+        if not row or row['acquired'] != 1:
+            raise RuntimeError(f"No se obtuvo el lock '{MIGRATION_LOCK}' en {MIGRATION_LOCK_TIMEOUT}s")
+        try:
+            return _migrate_locked(connection, cursor, target)
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK,))
+            cursor.fetchone()
+
+
+def _migrate_locked(connection, cursor, target):
+    touched = []
+    applied = set(applied_versions(cursor))
+
+    for migration in MIGRATIONS:
+        if migration.version <= target and migration.version not in applied:
+            _run_steps(cursor, migration.up)
+            cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                           (migration.version, migration.name))
+            connection.commit()
+            touched.append(migration.version)
+            print(f"⬆️ Migración {migration.version} ({migration.name}) aplicada")
+
+    for migration in reversed(MIGRATIONS):
+        if migration.version > target and migration.version in applied:
+            _run_steps(cursor, migration.down)
+            cursor.execute("DELETE FROM schema_migrations WHERE version = %s", (migration.version,))
+            connection.commit()
+            touched.append(migration.version)
+            print(f"⬇️ Migración {migration.version} ({migration.name}) revertida")
+    return touched
+
+
+# --- Verificación con EXPLAIN ---
+def explain_queries(cursor, checks):
+    """Ejecuta EXPLAIN sobre cada consulta (nombre, sql, args, índices esperados, obligatorio) y reporta el plan"""
+    results = []
+    for name, query, args, expected, required in checks:
+        cursor.execute(f"EXPLAIN {query}", args)
+        plan = cursor.fetchone()
+        extra = plan.get('Extra') or ''
+        results.append({
+            'query': name,
+            'key': plan.get('key'),
+            'extra': extra,
+            'ok': plan.get('key') in expected and 'Using filesort' not in extra,
+            'required': required
+        })
+    return results
+
+
+def _connect():
+    """Conexión directa para la CLI: importar app abriría conexiones y migraría a la última versión"""
+    import pymysql
+    from dotenv import load_dotenv
+    load_dotenv()
+    from config import Config
+    return pymysql.connect(
+        host=Config.MYSQL_HOST,
+        user=Config.MYSQL_USER,
+        password=Config.MYSQL_PASSWORD,
+        database=Config.MYSQL_DB,
+        port=Config.MYSQL_PORT,
+        charset='utf8mb4',
+        cursorclass=pymysql.cursors.DictCursor
+    )
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'status'
+    connection = _connect()
+    try:
+        if command == 'up':
+            migrate(connection, int(sys.argv[2]) if len(sys.argv) > 2 else None)
+        elif command == 'down':
+            migrate(connection, int(sys.argv[2]))
+        elif command == 'explain':
+            from product_queries import PRODUCT_QUERY_CHECKS
+            with connection.cursor() as cursor:
+                for result in explain_queries(cursor, PRODUCT_QUERY_CHECKS):
+                    mark = '✅' if result['ok'] else ('❌' if result['required'] else '⚠️')
+                    print(f"{mark} {result['query']}: key={result['key']} extra={result['extra']}")
+        else:
+            with connection.cursor() as cursor:
+                applied = set(applied_versions(cursor))
+            for migration in MIGRATIONS:
+                mark = '✅' if migration.version in applied else '⏳'
+                print(f"{mark} {migration.version:03d} {migration.name}")
+    finally:
+        connection.close()
@@ -0,0 +1,47 @@
+"""
+Consultas calientes de productos para Backend 2
+
+Módulo sin efectos secundarios: lo importan app.py, la CLI de migraciones
+(`python migrations.py explain`) y los tests sin abrir conexiones ni migrar.
+
+Las consultas no llevan hints de índice: el plan lo elige el optimizador y
+`explain_queries` verifica que sea el esperado.
+"""
+
+LIST_PRODUCTS_SQL = "SELECT * FROM products ORDER BY created_at DESC"
+
+# Las facetas se resuelven solo con el índice cubriente (category, price, stock), sin leer filas
+PRODUCT_FACETS_SQL = """
+    SELECT category,
+           COUNT(*) AS count,
+           SUM(stock > 0) AS in_stock,
+           MIN(price) AS min_price,
+           MAX(price) AS max_price
+    FROM products
+    GROUP BY category
+    ORDER BY category
+"""
+
+# Huella de la tabla para validar el snapshot del catálogo: toda escritura incrementa
+# version (SUM), las altas mueven MAX(id) y las bajas COUNT(*)
+CATALOG_STAMP_SQL = """
+    SELECT COUNT(*) AS count,
+           COALESCE(SUM(version), 0) AS version_sum,
+           MAX(id) AS max_id,
+           MAX(updated_at) AS updated_at
+    FROM products
+"""
+
+PRODUCTS_BY_CATEGORY_SQL = "SELECT id FROM products WHERE category = %s ORDER BY id"
+
+# (nombre, sql, args, índices esperados, obligatorio)
+# La lista completa no tiene filtro: con pocas filas o muchas páginas fuera de
+# memoria el optimizador puede preferir un recorrido completo con filesort, que
+# es un plan legítimo. Se reporta pero no hace fallar la verificación.
+PRODUCT_QUERY_CHECKS = [
+    ('list_by_created_at', LIST_PRODUCTS_SQL, (), ['idx_products_created_at'], False),
+    ('facets_by_category', PRODUCT_FACETS_SQL, (), ['idx_products_category_price_stock'], True),
+    ('filter_by_category', PRODUCTS_BY_CATEGORY_SQL, ('Electrónica',),
+     ['idx_products_category', 'idx_products_category_price_stock'], True),
+    ('batch_by_ids', "SELECT * FROM products WHERE id IN (%s, %s, %s)", (1, 2, 3), ['PRIMARY'], True),
+]
@@ -0,0 +1,49 @@
+"""
+Limitador de tasa por cliente (token bucket) para Backend 2
+
+Cada par (cliente, ruta) tiene un bucket con capacidad y ritmo de recarga
+propios. Los buckets viven en un OrderedDict acotado: cada operación es O(1)
+y al superar `max_keys` se descarta el cliente usado hace más tiempo.
+"""
+import math
+import time
+import threading
+from collections import OrderedDict
+
+
+class TokenBucketLimiter:
+    def __init__(self, max_keys=10000, clock=time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key, capacity, refill_rate, cost=1):
+        """Consume `cost` tokens del bucket de `key`.
+
+        Devuelve (permitido, tokens restantes, segundos hasta recuperar la capacidad,
+        segundos hasta poder reintentar).
+        """
+        now = self.clock()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                tokens = float(capacity)
+                if len(self._buckets) >= self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                tokens, updated_at = bucket
+                tokens = min(float(capacity), tokens + (now - updated_at) * refill_rate)
+                self._buckets.move_to_end(key)
+
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+
+        reset_after = math.ceil((capacity - tokens) / refill_rate) if refill_rate else 0
+        retry_after = 0 if allowed or not refill_rate else math.ceil((cost - tokens) / refill_rate)
+        return allowed, int(tokens), reset_after, retry_after
+
+    def __len__(self):
+        return len(self._buckets)
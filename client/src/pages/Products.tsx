@@ -3,12 +3,13 @@
 import type React from "react"
 import { useState, useEffect } from "react"
 import { backend2Api } from "../services/api"
-import type { Product } from "../types"
+import type { Product, ProductFacet } from "../types"
 import { Package, Plus, Edit, Trash2, Search, Filter, Star, Eye } from "lucide-react"
 import toast from "react-hot-toast"
 
 const Products: React.FC = () => {
   const [products, setProducts] = useState<Product[]>([])
+  const [facets, setFacets] = useState<ProductFacet[]>([])
   const [loading, setLoading] = useState(true)
   const [searchTerm, setSearchTerm] = useState("")
   const [selectedCategory, setSelectedCategory] = useState("")
@@ -24,14 +25,28 @@ const Products: React.FC = () => {
   })
 
   useEffect(() => {
+    loadFacets()
     loadProducts()
   }, [])
 
+  const loadFacets = async () => {
+    try {
+      const response = await backend2Api.get("/api/products/facets")
+      setFacets(response.data.data || [])
+    } catch (error) {
+      console.error("Error cargando categorías:", error)
+    }
+  }
+
   const loadProducts = async () => {
     try {
       setLoading(true)
       const response = await backend2Api.get("/api/products")
       setProducts(response.data.data || [])
+      if (response.data.error) {
+        // El servidor cortó la lista a mitad del streaming
+        toast.error("La lista de productos llegó incompleta")
+      }
     } catch (error) {
       console.error("Error cargando productos:", error)
       toast.error("Error al cargar productos")
@@ -40,7 +55,7 @@ const Products: React.FC = () => {
     }
   }
 
-  const categories = [...new Set(products.map((p) => p.category))]
+  const categories = facets.map((f) => f.category)
 
   const filteredProducts = products.filter((product) => {
     const matchesSearch =
@@ -60,7 +75,9 @@ const Products: React.FC = () => {
       }
 
       if (editingProduct) {
-        await backend2Api.put(`/api/products/${editingProduct.id}`, productData)
+        // If-Match evita sobrescribir cambios de otro administrador
+        const headers = editingProduct.version ? { "If-Match": `"${editingProduct.version}"` } : undefined
+        await backend2Api.put(`/api/products/${editingProduct.id}`, productData, { headers })
         toast.success("Producto actualizado exitosamente")
       } else {
         await backend2Api.post("/api/products", productData)
@@ -77,9 +94,17 @@ const Products: React.FC = () => {
         category: "",
         image_url: "",
       })
+      loadFacets()
       loadProducts()
-    } catch (error) {
+    } catch (error: any) {
       console.error("Error guardando producto:", error)
+      if (error?.response?.status === 412) {
+        toast.error("Otro usuario modificó este producto. Se recargaron los datos")
+        setShowModal(false)
+        setEditingProduct(null)
+        loadProducts()
+        return
+      }
       toast.error("Error al guardar producto")
     }
   }
@@ -102,6 +127,7 @@ const Products: React.FC = () => {
       try {
         await backend2Api.delete(`/api/products/${id}`)
         toast.success("Producto eliminado exitosamente")
+        loadFacets()
         loadProducts()
       } catch (error) {
         console.error("Error eliminando producto:", error)
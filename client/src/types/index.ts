@@ -17,6 +17,15 @@ export type Product = {
   description: string
   category: string
   image_url: string
+  version?: number
+}
+
+export type ProductFacet = {
+  category: string
+  count: number
+  in_stock: number
+  min_price: number | null
+  max_price: number | null
 }
 
 export interface Sale {